@@ -1,42 +1,171 @@
 import os
-from flask import Flask, request, abort, jsonify
+from flask import Flask, Response, request, abort, jsonify
+from flask.json import JSONEncoder
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from flask_caching import Cache
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from functools import lru_cache
+import orjson
 import random
+import hashlib
 
-from models import setup_db, Question, Category
+from models import setup_db, db, Question, Category, QUESTION_COLUMNS, format_rows
 
 QUESTIONS_PER_PAGE = 10
+QUIZ_POOL_TIMEOUT = 600
+
+cache = Cache()
+
+# fixed shape of the GET /questions payload, only the values are spliced in
+_QUESTIONS_TMPL = (b'{"success":true,"total_questions":%d,"questions":%s,'
+                   b'"current_category":null,"categories":%s}')
+
+# Categories do not change while the app runs, so they are read once and
+# kept in memory. Anything that writes categories must bump the version.
+_CAT_VERSION = [0]
+
+@lru_cache(maxsize=1)
+def _categories_snapshot(_version):
+  '''
+  Get a dictionary of category id to category type
+  '''
+  return {category.id: category.type
+          for category in Category.query.order_by(Category.id).all()}
+
+@lru_cache(maxsize=1)
+def _categories_json(_version):
+  '''
+  Get the categories dictionary already encoded as JSON bytes
+  '''
+  return orjson.dumps(_categories_snapshot(_version),
+                      option=orjson.OPT_NON_STR_KEYS)
+
+def make_etag(data):
+  '''
+  Get a short ETag value hashed from the given bytes
+  '''
+  return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+@lru_cache(maxsize=1)
+def _categories_etag(_version):
+  '''
+  Get the ETag of the encoded categories, kept next to the blob
+  '''
+  return make_etag(_categories_json(_version))
+
+def get_categories_dict():
+  return _categories_snapshot(_CAT_VERSION[0])
+
+def get_categories_json():
+  return _categories_json(_CAT_VERSION[0])
+
+def get_categories_etag():
+  return _categories_etag(_CAT_VERSION[0])
+
+def json_response(payload, status=200):
+  '''
+  Encode a payload straight to JSON bytes with orjson, skipping jsonify
+  '''
+  return Response(orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS),
+                  status=status, mimetype='application/json')
+
+class OrjsonEncoder(JSONEncoder):
+  '''
+  JSON encoder for jsonify that hands the encoding over to orjson
+  '''
+  def encode(self, o):
+    option = orjson.OPT_NON_STR_KEYS
+    #keep JSON_SORT_KEYS and the pretty printing jsonify asks for
+    if self.sort_keys:
+      option |= orjson.OPT_SORT_KEYS
+    if self.indent:
+      option |= orjson.OPT_INDENT_2
+    return orjson.dumps(o, default=self.default, option=option).decode()
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
+  app.json_encoder = OrjsonEncoder
   setup_db(app)
+  # The default 'simple' cache lives in each process, holding at most
+  # CACHE_THRESHOLD pools, so a write only clears it in the worker that
+  # served it. Use CACHE_TYPE=redis to share the pools between workers.
+  cache.init_app(app, config={
+    'CACHE_TYPE': os.environ.get('CACHE_TYPE', 'simple'),
+    'CACHE_THRESHOLD': 100,
+    'CACHE_REDIS_URL': os.environ.get('CACHE_REDIS_URL')
+  })
  
   '''
-  Set up CORS. Allow '*' for origins. 
+  Set up CORS. Allow '*' for origins, and let flask-cors
+  set the Access-Control-Allow headers as well.
   '''
-  CORS(app, resource={'/': {'origins':'*'}})
+  CORS(app, resources={r'/*': {'origins': '*'}},
+       allow_headers=['Content-Type', 'Authorization'],
+       methods=['GET', 'PUT', 'POST', 'DELETE', 'OPTIONS'])
 
-  def paginate_questions(request, selection):
+  def get_page_args(request):
     '''
-    Get paginated list of questions
+    Get the (page, after_id) pagination arguments of the request
     '''
-    page = request.args.get('page', 1, type=int)
-    start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
-    questions = [question.format() for question in selection]
-    current_questions = questions[start:end]
+    return (request.args.get('page', 1, type=int),
+            request.args.get('after_id', None, type=int))
 
-    return current_questions
-  '''
-  Using the after_request decorator to set Access-Control-Allow
-  '''
-  @app.after_request
-  def after_request(response):
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization,true')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-    return response
+  def paginate_questions(selection, page=1, after_id=None):
+    '''
+    Get paginated list of questions from a query, letting the database
+    return only the rows of the requested page. An after_id switches
+    to keyset pagination on the question id.
+    '''
+    #plain column tuples, no Question instances to build or lazy load
+    selection = selection.with_entities(*QUESTION_COLUMNS).order_by(Question.id)
+    if after_id is not None:
+      selection = selection.filter(Question.id > after_id)
+    elif page < 1:
+      return []
+    else:
+      selection = selection.offset((page - 1) * QUESTIONS_PER_PAGE)
+
+    return format_rows(selection.limit(QUESTIONS_PER_PAGE).all())
+
+  def count_questions():
+    '''
+    Get the number of questions without loading them
+    '''
+    return db.session.query(func.count(Question.id)).scalar()
+
+  def not_modified(etag):
+    '''
+    Get a 304 response if the client already holds this version,
+    otherwise None
+    '''
+    if request.if_none_match.contains(etag):
+      response = Response(status=304)
+      response.set_etag(etag)
+      return response
+
+  def quiz_pool(category_id):
+    '''
+    Get the ids of the questions a quiz can draw from, category 0
+    meaning all categories. Cached so each quiz turn skips the scan.
+    '''
+    key = 'quiz_pool:{}'.format(category_id)
+    pool = cache.get(key)
+    if pool is None:
+      selection = db.session.query(Question.id)
+      if category_id != 0:
+        selection = selection.filter(Question.category == category_id)
+      pool = [row.id for row in selection.all()]
+      cache.set(key, pool, timeout=QUIZ_POOL_TIMEOUT)
+    return pool
+
+  def forget_quiz_pools(category_id):
+    '''
+    Drop the cached pools a question in this category belongs to
+    '''
+    cache.delete_many('quiz_pool:0', 'quiz_pool:{}'.format(category_id))
 
 
   '''
@@ -50,19 +179,16 @@ def create_app(test_config=None):
     Fetches a dictionary of categories in which the keys are the ids
     and the value is the corresponding string of the category
     '''
-    selection = Category.query.order_by(Category.id).all()
-
-
-    category_dict = {}
-    for category in selection:
-      category_dict[category.id] = category.type
-
-  
-    return jsonify({
-      'success': True,
-      'categories': category_dict
-
-      })
+    etag = get_categories_etag()
+    response = not_modified(etag)
+    if response is not None:
+      return response
+
+    response = Response(
+      b'{"success":true,"categories":' + get_categories_json() + b'}',
+      mimetype='application/json')
+    response.set_etag(etag)
+    return response
 
   '''
   
@@ -85,24 +211,29 @@ def create_app(test_config=None):
     the id, question, category and difficulty.
     '''
     
-    selection = Question.query.all()
-    current_questions = paginate_questions(request, selection)
+    #the page only changes when questions or categories do
+    total, max_id = db.session.query(
+      func.count(Question.id), func.max(Question.id)).one()
+    page, after_id = get_page_args(request)
+    etag = make_etag('{}:{}:{}:{}:{}'.format(
+      page, after_id, total, max_id, _CAT_VERSION[0]).encode())
+
+    response = not_modified(etag)
+    if response is not None:
+      return response
 
-    categories = Category.query.all()
-    categories_dict = {}
-    for category in categories:
-      categories_dict[category.id] = category.type
+    current_questions = paginate_questions(Question.query, page, after_id)
 
     if len(current_questions) == 0:
       abort(404)
 
-    return jsonify({
-      'success': True,
-      'total_questions': len(selection),
-      'questions': current_questions,
-      'current_category': None,
-      'categories': categories_dict
-      })
+    body = _QUESTIONS_TMPL % (total,
+                              orjson.dumps(current_questions),
+                              get_categories_json())
+
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response
 
   '''
   An endpoint to DELETE question using a question ID. 
@@ -120,24 +251,29 @@ def create_app(test_config=None):
     '''
 
     try:
-      #question = Question.query.filter(Question.id == question_id).one_or_none()
-      question = Question.query.get(question_id)
-      if question is None:
+      #delete and learn whether the row existed in one round trip
+      table = Question.__table__
+      deleted = db.session.execute(
+        table.delete()
+        .where(table.c.id == question_id)
+        .returning(table.c.id, table.c.category)).first()
+      if deleted is None:
         abort(404)
 
-      question.delete()
+      db.session.commit()
+      forget_quiz_pools(deleted.category)
 
-      selection = Question.query.order_by(Question.id).all()
-      current_questions = paginate_questions(request, selection)
+      current_questions = paginate_questions(Question.query, *get_page_args(request))
 
       return jsonify({
         'success':True,
         'deleted': question_id,
         'questions': current_questions,
-        'total_questions': len(Question.query.all())      
+        'total_questions': count_questions()
         })
 
-    except:
+    except SQLAlchemyError:
+      db.session.rollback()
       abort(422)
 
 
@@ -170,18 +306,24 @@ def create_app(test_config=None):
 
 
     try:
-      question = Question(new_question, new_answer, new_category,new_difficulty)
-
-      question.insert()
-      print(question)
+      table = Question.__table__
+      created = db.session.execute(
+        table.insert()
+        .values(question=new_question, answer=new_answer,
+                category=new_category, difficulty=new_difficulty)
+        .returning(table.c.id, table.c.category)).first()
+
+      db.session.commit()
+      forget_quiz_pools(created.category)
       
       return jsonify ({
         'success': True,
-        'created': question.id,
-        'total_questions':len(Question.query.all())
+        'created': created.id,
+        'total_questions': count_questions()
         })
 
-    except:
+    except SQLAlchemyError:
+      db.session.rollback()
       abort(422)
 
   '''
@@ -199,29 +341,33 @@ def create_app(test_config=None):
 
     '''this function retrieves question by a search on a string''' 
     body = request.get_json()
-    print(body)
 
     search_term = body.get('searchTerm')
-    print(search_term)
 
     try:
 
-      if len(search_term) != 0:
-          search_results = Question.query.filter(
-              Question.question.ilike('%' + search_term + '%')).all()
+      if len(search_term) == 0:
+        abort(404)
 
-          if len(search_results) == 0:
-            abort(404)
+      selection = Question.query.filter(
+          Question.question.ilike('%' + search_term + '%'))
 
+      total = selection.with_entities(func.count(Question.id)).scalar()
+      if total == 0:
+        abort(404)
 
-      return jsonify({
+
+      return json_response({
           'success': True,
-          'questions': [question.format() for question in search_results],
-          'total_questions': len(search_results),
+          'questions': paginate_questions(selection, *get_page_args(request)),
+          'total_questions': total,
           'current_category': None
           })
-    except:
-      abort(404)
+    except TypeError:
+      abort(400)
+    except SQLAlchemyError:
+      db.session.rollback()
+      abort(422)
 
 
   ''' 
@@ -238,25 +384,21 @@ def create_app(test_config=None):
 
     '''this function get questions based on category'''
 
-    try:
-
-      
-      #retreive paginate question for the category
-      category = Category.query.filter_by(id=id).one_or_none()
+    categories_dict = get_categories_dict()
+    if id not in categories_dict:
+      abort(404)
 
-      selection = Question.query.filter_by(category=category.id).all()
+    #retreive paginate question for the category
+    selection = Question.query.filter_by(category=id)
 
-      paginated_question = paginate_questions(request, selection)
+    paginated_question = paginate_questions(selection, *get_page_args(request))
 
 
-      return jsonify({
-        'success': True, 
-        'questions': paginated_question, 
-        'current_category': category.type
-        })
-
-    except:
-      abort(404)
+    return json_response({
+      'success': True, 
+      'questions': paginated_question, 
+      'current_category': categories_dict[id]
+      })
 
 
   '''
@@ -285,49 +427,35 @@ def create_app(test_config=None):
 
 
       category = body.get('quiz_category')
-      previous_questions = body.get('previous_questions')
-
-      print(category)
-   
-      if (category['id'] == 0):
-        questions = Question.query.all()
-
-      else:
-        questions = Question.query.filter_by(category = category['id']).all()
-
-      
+      seen = frozenset(body.get('previous_questions'))
 
-      total = len(questions)
+      category_id = int(category['id'])
 
-      
-
-      #get random question
-      def get_random_question():
-        return questions[random.randrange(0, total, 1)]
-
-
-      #check if it has been shown before
-      def check_if_shownbefore(question):
-        
-        shownbefore=False
-        for i in previous_questions:
-          if (i == question.id):
-            shownbefore = True
-
-        return shownbefore
+      #pick one random question not shown before from the cached pool
+      remaining = [id for id in quiz_pool(category_id) if id not in seen]
 
-      question = get_random_question()
+      question = None
+      if remaining:
+        question = Question.query.get(random.choice(remaining))
 
-      print(question.format())
-
-      while(check_if_shownbefore(question)):
-        question = get_random_question()
+      #the pool may be stale, e.g. questions added or deleted through
+      #another worker, so ask the database before ending the quiz
+      if question is None:
+        selection = Question.query
+        if category_id != 0:
+          selection = selection.filter(Question.category == category_id)
+        if seen:
+          selection = selection.filter(~Question.id.in_(seen))
+        question = selection.order_by(func.random()).limit(1).first()
 
+        if remaining or question is not None:
+          forget_quiz_pools(category_id)
 
-        if (len(previous_questions) == total):
-          return jsonify({
-            'success': True
-            })
+      #every question has been shown
+      if question is None:
+        return jsonify({
+          'success': True
+          })
 
 
       return jsonify({
@@ -337,8 +465,11 @@ def create_app(test_config=None):
       })
 
 
-    except:
+    except (KeyError, TypeError, ValueError):
       abort(400)
+    except SQLAlchemyError:
+      db.session.rollback()
+      abort(422)
 
 
   '''
@@ -15,6 +15,14 @@ setup_db(app)
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # keep a warm set of connections, reused most-recent first
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_size": 20,
+        "max_overflow": 40,
+        "pool_pre_ping": False,
+        "pool_recycle": 1800,
+        "pool_use_lifo": True
+    }
     db.app = app
     db.init_app(app)
     db.create_all()
@@ -58,6 +66,20 @@ class Question(db.Model):
       'difficulty': self.difficulty
     }
 
+'''
+QUESTION_COLUMNS
+    the Question columns, for queries that only need the row values
+    and not full Question instances
+format_rows(rows)
+    turns the keyed rows selected with QUESTION_COLUMNS into the
+    dicts Question.format() returns
+'''
+QUESTION_COLUMNS = (Question.id, Question.question, Question.answer,
+                    Question.category, Question.difficulty)
+
+def format_rows(rows):
+    return [row._asdict() for row in rows]
+
 '''
 Category
 
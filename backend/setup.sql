@@ -3,3 +3,5 @@ CREATE USER tomiwa WITH ENCRYPTED PASSWORD 'student';
 GRANT ALL PRIVILEGES ON DATABASE trivia_app TO tomiwa;
 ALTER USER tomiwa CREATEDB;
 ALTER USER tomiwa WITH SUPERUSER;
+\connect trivia_app
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
@@ -3,7 +3,7 @@ import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
 
-from flaskr import create_app
+from flaskr import create_app, QUESTIONS_PER_PAGE
 from models import setup_db, Question, Category
 
 
@@ -50,6 +50,21 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertTrue(data['message'], 'resource not found')
 
+    def test_get_questions_after_id(self):
+        '''test keyset pagination returns the questions after the given id'''
+        first_id = Question.query.order_by(Question.id).first().id
+
+        res = self.client().get('/questions?after_id=' + str(first_id))
+        data = json.loads(res.data)
+        ids = [question['id'] for question in data['questions']]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(len(ids))
+        self.assertLessEqual(len(ids), QUESTIONS_PER_PAGE)
+        self.assertTrue(all(id > first_id for id in ids))
+        self.assertEqual(ids, sorted(ids))
+
 #------------------------
 
     def test_get_categories(self):
@@ -63,6 +78,47 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(data['categories']))
 
 
+    def test_get_categories_not_modified(self):
+        '''test 304 response when the categories etag still matches'''
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+
+    def test_get_questions_not_modified(self):
+        '''test 304 response when the questions page etag still matches'''
+        res = self.client().get('/questions?page=1')
+        etag = res.headers['ETag']
+
+        res = self.client().get('/questions?page=1', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_questions_etag_changes_after_post_and_delete(self):
+        '''test the questions etag changes when a question is added or deleted'''
+        etag_before = self.client().get('/questions').headers['ETag']
+
+        res = self.client().post('/questions', json={
+            'question': 'Do I change the etag?', 'answer': 'Yes',
+            'difficulty': 1, 'category': 1})
+        question_id = json.loads(res.data)['created']
+        res = self.client().get('/questions', headers={'If-None-Match': etag_before})
+        etag_added = res.headers['ETag']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(etag_added, etag_before)
+
+        self.client().delete('/questions/' + str(question_id))
+        res = self.client().get('/questions', headers={'If-None-Match': etag_added})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag_added)
+
     def test_404_for_non_existing_categories(self):
         '''test error response for getting non existing categories of question'''
         res = self.client().get('/categories/9999')
@@ -104,6 +160,16 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'resource not found')
         
+    def test_404_sent_deleting_missing_question_id(self):
+        '''test error response for deleting a question id that does not exist'''
+
+        res = self.client().delete('/questions/999999')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'resource not found')
+
 #----------------------
 
     def test_posting_a_new_question(self):
@@ -155,6 +221,16 @@ class TriviaTestCase(unittest.TestCase):
 
 
 
+    def test_search_results_are_paginated(self):
+        '''Test search returns one page of matches and the full total'''
+        res = self.client().post('/questions/search?page=1', json={'searchTerm': 'e'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertLessEqual(len(data['questions']), QUESTIONS_PER_PAGE)
+        self.assertGreaterEqual(data['total_questions'], len(data['questions']))
+
+
     def test_error_searching_for_a_question(self):
         '''Test display error in search for a question by a given string'''
         res = self.client().post('/questions/search', json={'searchTerm': 'zxcvb'})
@@ -203,6 +279,41 @@ class TriviaTestCase(unittest.TestCase):
         self.assertNotEqual(data['question']['id'], 2)
         #self.assertNotEqual(data['question']['id'], 21)
 
+    def test_quiz_draws_question_added_after_pool_was_cached(self):
+        '''Test a question added behind the cached quiz pool can still be drawn'''
+        quiz_category = {'type': 'Science', 'id': 1}
+        self.client().post('/quizzez', json={'quiz_category': quiz_category,
+                                             'previous_questions': []})
+
+        #insert directly, as another worker would, so this pool is not cleared
+        question = Question(question='Was I added after the pool?', answer='Yes',
+                            difficulty=1, category=1)
+        question.insert()
+        question_id = question.id
+        others = [q.id for q in Question.query.filter(Question.category == 1).all()
+                  if q.id != question_id]
+
+        res = self.client().post('/quizzez', json={'quiz_category': quiz_category,
+                                                   'previous_questions': others})
+        data = json.loads(res.data)
+        question.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['question']['id'], question_id)
+
+    def test_quiz_ends_when_every_question_was_shown(self):
+        '''Test no question is returned once the category is exhausted'''
+        shown = [q.id for q in Question.query.filter(Question.category == 1).all()]
+
+        res = self.client().post('/quizzez', json={'quiz_category': {'type': 'Science', 'id': 1},
+                                                   'previous_questions': shown})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertNotIn('question', data)
+
     def test_error_get_random_quiz_question_not_previous_diplayed(self):
         '''Test error in getting random quiz question not previously displayed'''
 
@@ -14,6 +14,7 @@ class QuestionView extends Component {
       totalQuestions: 0,
       categories: {},
       currentCategory: null,
+      searchTerm: null,
     }
   }
 
@@ -41,7 +42,13 @@ class QuestionView extends Component {
   }
 
   selectPage(num) {
-    this.setState({page: num}, () => this.getQuestions());
+    this.setState({page: num}, () => {
+      if (this.state.searchTerm) {
+        this.getSearchResults();
+      } else {
+        this.getQuestions();
+      }
+    });
   }
 
   createPagination(){
@@ -77,12 +84,16 @@ class QuestionView extends Component {
   }
 
   submitSearch = (searchTerm) => {
+    this.setState({searchTerm: searchTerm, page: 1}, () => this.getSearchResults());
+  }
+
+  getSearchResults = () => {
     $.ajax({
-      url: `/questions/search`, //TODO: update request URL
+      url: `/questions/search?page=${this.state.page}`, //TODO: update request URL
       type: "POST",
       dataType: 'json',
       contentType: 'application/json',
-      data: JSON.stringify({searchTerm: searchTerm}),
+      data: JSON.stringify({searchTerm: this.state.searchTerm}),
       xhrFields: {
         withCredentials: true
       },
@@ -123,7 +134,7 @@ class QuestionView extends Component {
     return (
       <div className="question-view">
         <div className="categories-list">
-          <h2 onClick={() => {this.getQuestions()}}>Categories</h2>
+          <h2 onClick={() => {this.setState({searchTerm: null}, () => this.getQuestions())}}>Categories</h2>
           <ul>
             {Object.keys(this.state.categories).map((id, ) => (
               <li key={id} onClick={() => {this.getByCategory(id)}}>